@@ -0,0 +1,317 @@
+"""
+Модуль захвата видео с минимальной задержкой (FFmpeg, GStreamer, V4L2)
+"""
+import re
+import sys
+import subprocess
+import cv2
+import numpy as np
+
+try:
+    import ffmpeg
+except ImportError:
+    ffmpeg = None
+
+NETWORK_PREFIXES = ('rtsp://', 'rtmp://', 'http://', 'https://', 'udp://', 'tcp://')
+# NVDEC декодеры для кодеков, которые умеет ffmpeg -c:v *_cuvid
+CUVID_DECODERS = {
+    'h264': 'h264_cuvid',
+    'hevc': 'hevc_cuvid',
+}
+
+
+def has_gstreamer():
+    """Проверяет, собран ли OpenCV с поддержкой GStreamer"""
+    return re.search(r'GStreamer:\s*YES', cv2.getBuildInformation()) is not None
+
+
+def _gst_quote(value):
+    """
+    Значение свойства для строки gst-launch: в кавычках, с экранированными
+    обратным слэшем и кавычками - пробелы и '!' в URL или пути не ломают pipeline
+    """
+    escaped = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def gstreamer_rtsp_pipeline(url, nvdec=False):
+    """
+    Строит GStreamer pipeline для RTSP, который отбрасывает старые кадры:
+    appsink держит один кадр, read() всегда возвращает самый свежий
+
+    Args:
+        url: адрес RTSP потока
+        nvdec: декодировать H.264 на NVDEC (nvv4l2decoder) вместо decodebin
+    """
+    if nvdec:
+        decode = (
+            "rtph264depay ! h264parse ! nvv4l2decoder ! nvvidconv ! "
+            "video/x-raw,format=BGRx ! videoconvert"
+        )
+    else:
+        decode = "decodebin ! videoconvert"
+    return (
+        f"rtspsrc location={_gst_quote(url)} latency=0 ! {decode} ! "
+        "video/x-raw,format=BGR ! appsink drop=true max-buffers=1 sync=false"
+    )
+
+
+def gstreamer_nvenc_pipeline(output_path):
+    """
+    Строит GStreamer pipeline для cv2.VideoWriter, кодирующий H.264 на NVENC
+
+    Args:
+        output_path: путь к итоговому .mp4 файлу
+    """
+    return (
+        "appsrc ! videoconvert ! video/x-raw,format=BGRx ! nvvidconv ! "
+        "video/x-raw(memory:NVMM),format=NV12 ! nvv4l2h264enc ! h264parse ! "
+        f"mp4mux ! filesink location={_gst_quote(output_path)}"
+    )
+
+
+def is_network_stream(source):
+    """Проверяет, является ли источник сетевым потоком"""
+    return isinstance(source, str) and source.lower().startswith(NETWORK_PREFIXES)
+
+
+def probe_stream(source):
+    """
+    Определяет параметры видеопотока через ffprobe
+
+    Args:
+        source: путь к файлу или URL потока
+
+    Returns:
+        Словарь с ключами width, height, fps, frame_count, codec
+    """
+    kwargs = {}
+    if source.lower().startswith('rtsp://'):
+        kwargs['rtsp_transport'] = 'tcp'
+    info = ffmpeg.probe(source, **kwargs)
+    video = next(s for s in info['streams'] if s['codec_type'] == 'video')
+
+    num, _, den = video.get('avg_frame_rate', '0/1').partition('/')
+    fps = float(num) / float(den) if den and float(den) else 0.0
+
+    # nb_frames есть не во всех контейнерах (например MKV) - тогда оцениваем по длительности
+    frame_count = int(video.get('nb_frames', 0) or 0)
+    if not frame_count:
+        duration = video.get('duration') or info.get('format', {}).get('duration')
+        if duration and fps:
+            frame_count = int(round(float(duration) * fps))
+
+    # ffmpeg по умолчанию поворачивает кадры по метаданным -
+    # при повороте на 90/270 градусов ширина и высота меняются местами
+    width, height = int(video['width']), int(video['height'])
+    if _stream_rotation(video) % 180 == 90:
+        width, height = height, width
+
+    return {
+        'width': width,
+        'height': height,
+        'fps': fps,
+        'frame_count': frame_count,
+        'codec': video.get('codec_name', ''),
+    }
+
+
+def _stream_rotation(video):
+    """Угол поворота видеопотока в градусах из тега rotate или side data"""
+    rotation = video.get('tags', {}).get('rotate')
+    if rotation is None:
+        for side_data in video.get('side_data_list', []):
+            if 'rotation' in side_data:
+                rotation = side_data['rotation']
+                break
+    try:
+        return int(float(rotation or 0)) % 360
+    except ValueError:
+        return 0
+
+
+def open_ffmpeg_stream(url, w, h, decoder=None):
+    """
+    Запускает ffmpeg, который отдает сырые BGR кадры в stdout
+
+    Args:
+        url: путь к файлу или URL потока
+        w, h: размер кадра после поворота по метаданным (как в probe_stream)
+        decoder: имя декодера (например 'h264_cuvid'), None - программный
+
+    Returns:
+        subprocess.Popen с stdout=PIPE
+    """
+    input_kwargs = {}
+    if is_network_stream(url):
+        # Не копим кадры в буфере ffmpeg - задержка не растет со временем
+        input_kwargs.update(fflags='nobuffer', flags='low_delay')
+        if url.lower().startswith('rtsp://'):
+            input_kwargs['rtsp_transport'] = 'tcp'
+    if decoder:
+        input_kwargs['vcodec'] = decoder
+
+    args = (
+        ffmpeg
+        .input(url, **input_kwargs)
+        .output('pipe:', format='rawvideo', pix_fmt='bgr24', s=f'{w}x{h}')
+        .global_args('-loglevel', 'error', '-nostdin')
+        .compile()
+    )
+    return subprocess.Popen(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        bufsize=w * h * 3
+    )
+
+
+class FFmpegCapture:
+    """
+    Замена cv2.VideoCapture поверх ffmpeg pipe.
+
+    Кадры читаются в кольцо заранее выделенных буферов, поэтому
+    возвращенный кадр остается валидным, пока не будет прочитано
+    еще `buffers` кадров.
+    """
+
+    def __init__(self, source, hwaccel=True, buffers=16):
+        """
+        Args:
+            source: путь к файлу или URL потока
+            hwaccel: использовать NVDEC (только для сетевых потоков)
+            buffers: размер кольца буферов кадров
+        """
+        self.source = source
+        info = probe_stream(source)
+        self.width = info['width']
+        self.height = info['height']
+        self.fps = info['fps']
+        self.frame_count = info['frame_count']
+        self._frame_bytes = self.width * self.height * 3
+        self._ring = [
+            np.empty((self.height, self.width, 3), dtype=np.uint8)
+            for _ in range(max(buffers, 2))
+        ]
+        self._ring_idx = 0
+        self._pending = None
+
+        decoder = None
+        if hwaccel and is_network_stream(source):
+            decoder = CUVID_DECODERS.get(info['codec'])
+        self.proc = open_ffmpeg_stream(source, self.width, self.height, decoder)
+
+        # Если NVDEC недоступен, ffmpeg завершится без кадров -
+        # перезапускаем с программным декодером
+        if decoder:
+            ret, frame = self.read()
+            if not ret:
+                self._close_proc()
+                self.proc = open_ffmpeg_stream(source, self.width, self.height)
+            else:
+                self._pending = frame
+
+    def _read_into(self, buf):
+        """Читает ровно один кадр в buf, возвращает успех"""
+        view = memoryview(buf).cast('B')
+        filled = 0
+        while filled < self._frame_bytes:
+            n = self.proc.stdout.readinto(view[filled:])
+            if not n:
+                return False
+            filled += n
+        return True
+
+    def read(self):
+        """Аналог cv2.VideoCapture.read()"""
+        if self._pending is not None:
+            frame, self._pending = self._pending, None
+            return True, frame
+        if self.proc is None:
+            return False, None
+
+        buf = self._ring[self._ring_idx]
+        if not self._read_into(buf):
+            return False, None
+        self._ring_idx = (self._ring_idx + 1) % len(self._ring)
+        return True, buf
+
+    def isOpened(self):
+        return self.proc is not None
+
+    def get(self, prop_id):
+        """Аналог cv2.VideoCapture.get() для используемых свойств"""
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop_id == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.frame_count)
+        return 0.0
+
+    def _close_proc(self):
+        if self.proc is not None:
+            self.proc.stdout.close()
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+    def release(self):
+        """Останавливает процесс ffmpeg"""
+        self._close_proc()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def __del__(self):
+        # В отличие от cv2.VideoCapture, дочерний процесс сам не завершится при сборке мусора.
+        # proc может не быть, если конструктор упал на ffprobe
+        if getattr(self, 'proc', None) is not None:
+            self._close_proc()
+
+
+def open_capture(source, buffers=16):
+    """
+    Открывает источник видео с минимальной задержкой:
+    - номер камеры: V4L2 (Linux) с буфером в один кадр
+    - rtsp://: GStreamer с отбрасыванием старых кадров, если доступен
+      (сначала с NVDEC, затем с программным decodebin)
+    - остальное: FFmpeg pipe, при недоступности - OpenCV (CAP_FFMPEG для сети)
+
+    Args:
+        source: номер камеры, путь к файлу или URL потока
+        buffers: размер кольца буферов кадров FFmpeg (должен превышать
+                 число кадров, одновременно находящихся в обработке)
+    """
+    if isinstance(source, int):
+        backend = cv2.CAP_V4L2 if sys.platform.startswith('linux') else cv2.CAP_ANY
+        cap = cv2.VideoCapture(source, backend)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    if source.lower().startswith('rtsp://') and sys.platform.startswith('linux') and has_gstreamer():
+        for nvdec in (True, False):
+            cap = cv2.VideoCapture(gstreamer_rtsp_pipeline(source, nvdec), cv2.CAP_GSTREAMER)
+            if cap.isOpened():
+                return cap
+            cap.release()
+
+    if ffmpeg is not None:
+        try:
+            return FFmpegCapture(source, buffers=buffers)
+        except (ffmpeg.Error, OSError, StopIteration, KeyError, ValueError):
+            pass
+
+    # Сетевой поток - явно через FFmpeg backend, он поддерживает буфер в один кадр
+    if is_network_stream(source):
+        cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG)
+    else:
+        cap = cv2.VideoCapture(source)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return cap
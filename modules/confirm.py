@@ -0,0 +1,88 @@
+"""
+Пакетное подтверждение нарушений (буфер сна) на битовых масках классов
+"""
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """Без numba функция остается обычной Python-функцией"""
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+def mask_to_names(mask, class_to_bit):
+    """
+    Переводит битовую маску обратно в set названий классов
+
+    Args:
+        mask: битовая маска классов
+        class_to_bit: словарь {название: бит} (CLASS_TO_BIT из modules.detection)
+    """
+    return {name for name, bit in class_to_bit.items() if mask & bit}
+
+
+@njit(cache=True)
+def confirm_batch(times, masks, sleep_buffer, sleep_start_in, sleep_bit):
+    """
+    Та же логика, что process_frame_for_detection_correct, для батча кадров
+
+    Args:
+        times: время каждого кадра (float64)
+        masks: битовые маски обнаруженных классов по кадрам (uint32)
+        sleep_buffer: буфер подтверждения сна в секундах
+        sleep_start_in: время начала сна до батча (NaN - сна не было)
+        sleep_bit: бит класса 'sleeping'
+
+    Returns:
+        (confirmed_mask, new_sleep_start) - маски подтвержденных нарушений
+        по кадрам и время начала сна после батча (NaN - сна нет)
+    """
+    n = times.shape[0]
+    confirmed = np.zeros(n, dtype=np.uint32)
+    sleep_start = sleep_start_in
+    sleep = np.uint32(sleep_bit)
+
+    for i in range(n):
+        # Остальные нарушения подтверждаются сразу
+        mask = masks[i] & ~sleep
+        if masks[i] & sleep:
+            if np.isnan(sleep_start):
+                sleep_start = times[i]
+            if times[i] - sleep_start >= sleep_buffer:
+                mask = mask | sleep
+        else:
+            sleep_start = np.nan
+        confirmed[i] = mask
+
+    return confirmed, sleep_start
+
+
+def confirm_detections(times, masks, sleep_start_time, sleep_buffer, sleep_bit):
+    """
+    Подтверждает нарушения сразу для всех кадров батча
+
+    Args:
+        times: список времени кадров
+        masks: список битовых масок детекций (по одной на кадр)
+        sleep_start_time: время начала сна (или None)
+        sleep_buffer: буфер подтверждения сна в секундах
+        sleep_bit: бит класса 'sleeping' (SLEEP_BIT из modules.detection)
+
+    Returns:
+        (список масок подтвержденных нарушений, new_sleep_start_time)
+    """
+    confirmed_mask, new_sleep_start = confirm_batch(
+        np.asarray(times, dtype=np.float64),
+        np.asarray(masks, dtype=np.uint32),
+        float(sleep_buffer),
+        np.nan if sleep_start_time is None else float(sleep_start_time),
+        sleep_bit
+    )
+
+    confirmed = [int(mask) for mask in confirmed_mask]
+    new_sleep_start = None if np.isnan(new_sleep_start) else float(new_sleep_start)
+    return confirmed, new_sleep_start
+
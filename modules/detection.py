@@ -7,6 +7,16 @@ import numpy as np
 from datetime import datetime
 from ultralytics import YOLO
 
+CLASS_NAMES_MAP = {
+    0: 'sleeping', 
+    1: 'phone', 
+    2: 'food', 
+    3: 'bottle'
+}
+# Бит класса в маске детекций: 1 << id класса
+CLASS_TO_BIT = {name: 1 << cls_id for cls_id, name in CLASS_NAMES_MAP.items()}
+SLEEP_BIT = CLASS_TO_BIT['sleeping']
+
 class ViolationDetector:
     """Детектор нарушений дисциплины"""
     
@@ -19,12 +29,8 @@ class ViolationDetector:
         self.model = YOLO(model_path)
         self.conf_threshold = conf_threshold
         self.target_classes = [0, 1, 2, 3]
-        self.class_names_map = {
-            0: 'sleeping', 
-            1: 'phone', 
-            2: 'food', 
-            3: 'bottle'
-        }
+        self.class_names_map = CLASS_NAMES_MAP
+        self.class_to_bit = CLASS_TO_BIT
         
     def detect_frame(self, frame, draw_boxes=False):
         """
@@ -35,13 +41,47 @@ class ViolationDetector:
             draw_boxes: рисовать ли боксы (default: False, пусть рисует app.py)
             
         Returns:
-            Словарь с обнаруженными нарушениями и аннотированное изображение
+            Словарь с обнаруженными нарушениями, битовая маска обнаруженных
+            классов и аннотированное изображение
         """
         results = self.model(frame, conf=self.conf_threshold, verbose=False)[0]
         
-        detections = {}
+        detections, detections_mask = self._parse_results(results)
         annotated_frame = frame.copy()
         
+        # Рисуем ТОЛЬКО если явно указано
+        if draw_boxes:
+            for cls_name, boxes_list in detections.items():
+                for box_info in boxes_list:
+                    x1, y1, x2, y2 = map(int, box_info['box'])
+                    cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
+                    label = f"{cls_name} {box_info['conf']:.2f}"
+                    cv2.putText(annotated_frame, label, (x1, y1 - 10),
+                               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+        
+        return detections, detections_mask, annotated_frame
+    
+    def detect_batch(self, frames):
+        """
+        Детектирует нарушения сразу в нескольких кадрах одним вызовом модели
+        
+        Args:
+            frames: список изображений (np.ndarray)
+            
+        Returns:
+            Список пар (словарь нарушений, битовая маска) по одной на кадр
+        """
+        results = self.model(list(frames), conf=self.conf_threshold, verbose=False)
+        return [self._parse_results(r) for r in results]
+    
+    def _parse_results(self, results):
+        """
+        Преобразует результат YOLO в словарь {класс: [{'conf', 'box'}]}
+        и битовую маску обнаруженных классов (биты из CLASS_TO_BIT)
+        """
+        detections = {}
+        detections_mask = 0
+        
         for box in results.boxes:
             cls_id = int(box.cls[0])
             cls_name = self.class_names_map.get(cls_id, str(cls_id))
@@ -51,22 +91,16 @@ class ViolationDetector:
                 # Сохраняем обнаруженные классы
                 if cls_name not in detections:
                     detections[cls_name] = []
+                    detections_mask |= 1 << cls_id
                 detections[cls_name].append({
                     'conf': conf,
                     'box': box.xyxy[0].cpu().numpy()
                 })
-                
-                # Рисуем ТОЛЬКО если явно указано
-                if draw_boxes:
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-                    label = f"{cls_name} {conf:.2f}"
-                    cv2.putText(annotated_frame, label, (x1, y1 - 10),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
         
-        return detections, annotated_frame
+        return detections, detections_mask
     
-    def draw_detections(self, frame, detections, violation_names=None):
+    def draw_detections(self, frame, detections, violation_names=None, out=None,
+                        recording=False):
         """
         Рисует боксы только для указанных нарушений
         
@@ -75,11 +109,20 @@ class ViolationDetector:
             detections: словарь обнаруженных объектов из detect_frame()
             violation_names: set названий нарушений, которые нужно отрисовать
                            Если None, рисует все
+            out: буфер для результата той же формы, что frame. Если None,
+                 возвращается новая копия кадра: детектор общий для всех
+                 сессий (st.cache_resource), внутренний буфер они бы перезаписывали
+            recording: нарисовать индикатор записи (красный круг) в том же
+                       проходе, без отдельной копии кадра
             
         Returns:
-            Аннотированное изображение с боксами
+            Аннотированное изображение с боксами (out или новая копия)
         """
-        annotated_frame = frame.copy()
+        if out is None:
+            annotated_frame = frame.copy()
+        else:
+            np.copyto(out, frame)
+            annotated_frame = out
         
         if violation_names is None:
             violation_names = set(detections.keys())
@@ -97,6 +140,9 @@ class ViolationDetector:
                     cv2.putText(annotated_frame, label, (x1, y1 - 10),
                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
         
+        if recording:
+            cv2.circle(annotated_frame, (30, 30), 10, (0, 0, 255), -1)
+        
         return annotated_frame
     
     def get_class_names(self):
@@ -9,6 +9,14 @@ from pathlib import Path
 from datetime import datetime
 from insightface.app import FaceAnalysis
 
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+# С какого размера БД искать через HNSW; на малых БД точный поиск numpy быстрее
+ANN_MIN_DB_SIZE = 256
+
 class FaceRecognizer:
     """Распознаватель лиц из видеосегментов"""
     
@@ -20,6 +28,10 @@ class FaceRecognizer:
         self.app = self._init_face_app()
         self.db = {}
         self.db_path = db_path
+        # Индекс поиска по БД: имена и нормированные эмбеддинги (строки матрицы)
+        self._db_names = []
+        self._db_matrix = None
+        self._ann_index = None
         
         if db_path and os.path.exists(db_path):
             self.load_database(db_path)
@@ -44,6 +56,49 @@ class FaceRecognizer:
         except Exception as e:
             print(f"Ошибка загрузки БД лиц: {e}")
             self.db = {}
+        self._build_index()
+    
+    def _build_index(self):
+        """
+        Строит индекс поиска по БД один раз при загрузке.
+        Эмбеддинги нормируются, поэтому скалярное произведение = косинусное сходство.
+        Для больших БД (и установленного faiss) - HNSW, иначе точный поиск матрицей.
+        """
+        self._db_names = list(self.db.keys())
+        self._db_matrix = None
+        self._ann_index = None
+        if not self._db_names:
+            return
+        
+        matrix = np.stack([
+            np.asarray(emb, dtype=np.float32).ravel() for emb in self.db.values()
+        ])
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        self._db_matrix = np.ascontiguousarray(matrix)
+        
+        if faiss is not None and len(self._db_names) >= ANN_MIN_DB_SIZE:
+            index = faiss.IndexHNSWFlat(matrix.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = 64
+            index.add(self._db_matrix)
+            self._ann_index = index
+    
+    def _best_match(self, embedding):
+        """
+        Ищет в БД самое похожее лицо
+        
+        Returns:
+            Кортеж (имя_студента, косинусное_сходство)
+        """
+        query = np.asarray(embedding, dtype=np.float32).ravel()
+        query = query / np.linalg.norm(query)
+        
+        if self._ann_index is not None:
+            sims, ids = self._ann_index.search(query[None], 1)
+            return self._db_names[int(ids[0, 0])], float(sims[0, 0])
+        
+        sims = self._db_matrix @ query
+        best = int(np.argmax(sims))
+        return self._db_names[best], float(sims[best])
     
     def analyze_video_segment(self, video_path, face_similarity=0.5):
         """
@@ -61,9 +116,6 @@ class FaceRecognizer:
         max_score = 0.0
         best_face_img = None
         
-        # Словарь для подсчета совпадений каждого студента
-        student_scores = {}  # {student_name: [scores]}
-        
         frame_idx = 0
         while True:
             ret, frame = cap.read()
@@ -76,29 +128,20 @@ class FaceRecognizer:
                     faces = self.app.get(frame)
                     for face in faces:
                         if self.db:
-                            # Ищем совпадение в БД
-                            for db_name, db_emb in self.db.items():
-                                sim = self._cosine_similarity(
-                                    face.embedding, 
-                                    db_emb
-                                )
+                            # Ищем совпадение в БД (индекс построен при загрузке)
+                            db_name, sim = self._best_match(face.embedding)
+                            
+                            # Обновляем лучший глобальный результат
+                            if sim > max_score:
+                                max_score = sim
+                                best_name = db_name
                                 
-                                # Собираем результаты для каждого студента
-                                if db_name not in student_scores:
-                                    student_scores[db_name] = []
-                                student_scores[db_name].append(sim)
-                                
-                                # Обновляем лучший глобальный результат
-                                if sim > max_score:
-                                    max_score = sim
-                                    best_name = db_name
-                                    
-                                    # Вырезаем лицо
-                                    box = face.bbox.astype(int)
-                                    h, w = frame.shape[:2]
-                                    x1, y1 = max(0, box[0]), max(0, box[1])
-                                    x2, y2 = min(w, box[2]), min(h, box[3])
-                                    best_face_img = frame[y1:y2, x1:x2].copy()
+                                # Вырезаем лицо
+                                box = face.bbox.astype(int)
+                                h, w = frame.shape[:2]
+                                x1, y1 = max(0, box[0]), max(0, box[1])
+                                x2, y2 = min(w, box[2]), min(h, box[3])
+                                best_face_img = frame[y1:y2, x1:x2].copy()
                 except Exception:
                     # Пропускаем ошибки обработки кадров
                     pass
@@ -107,23 +150,6 @@ class FaceRecognizer:
         
         cap.release()
         
-        # Если есть результаты, выбираем студента с наиболее уверенным совпадением
-        if student_scores:
-            # Для каждого студента берем МАКСИМАЛЬНОЕ совпадение (лучший кадр)
-            best_student = None
-            best_avg = 0.0
-            
-            for student_name, scores in student_scores.items():
-                max_sim = max(scores)  # Лучшее совпадение этого студента
-                avg_sim = np.mean(scores)  # Среднее совпадение
-                
-                # Выбираем студента с максимальным лучшим совпадением
-                if max_sim > best_avg:
-                    best_avg = max_sim
-                    best_student = student_name
-                    best_name = student_name
-                    max_score = max_sim
-        
         # Сохраняем фото лица
         saved_face_path = "Нет лица"
         if best_face_img is not None and best_face_img.size > 0:
@@ -137,13 +163,6 @@ class FaceRecognizer:
         
         return best_name, max_score, saved_face_path
     
-    @staticmethod
-    def _cosine_similarity(vec1, vec2):
-        """Вычисляет косинусовое сходство между двумя векторами"""
-        return np.dot(vec1, vec2) / (
-            np.linalg.norm(vec1) * np.linalg.norm(vec2)
-        )
-    
     def is_database_available(self):
         """Проверяет наличие базы данных"""
         return len(self.db) > 0
@@ -0,0 +1,201 @@
+"""
+Конвейер обработки видео: чтение → детекция → запись
+"""
+import queue
+import threading
+import numpy as np
+
+
+class FramePipeline:
+    """
+    Трехступенчатый конвейер на двух ограниченных очередях.
+
+    Поток чтения декодирует кадры в read_q, основной поток забирает их
+    через итерацию (детекция, Streamlit), а поток записи выполняет
+    задания из write_q (start_recording / write_frame / stop_recording)
+    строго в порядке постановки. Детектор остается в основном потоке.
+    """
+
+    def __init__(self, cap, prefetch=8, max_frames=None, frame_skip=1, write_prefetch=None,
+                 latest_only=False):
+        """
+        Args:
+            cap: источник кадров с методами read() и isOpened()
+            prefetch: размер очереди чтения (и записи, если write_prefetch не задан)
+            max_frames: максимальное число кадров (None - без ограничения)
+            frame_skip: детекция на каждом N-м кадре - итерация выдает
+                        флаг detect для таких кадров
+            write_prefetch: размер очереди записи - сколько заданий записи
+                            может накопиться, прежде чем submit() заблокируется
+            latest_only: если основной поток отстает, отдавать самый свежий
+                         кадр из очереди (для живых потоков). Пропущенные
+                         кадры не теряются для записи - они лежат в dropped
+        """
+        self.cap = cap
+        self.max_frames = max_frames
+        self.frame_skip = frame_skip
+        self.latest_only = latest_only
+        # (номер_кадра, кадр), пропущенные перед текущим кадром в режиме latest_only
+        self.dropped = []
+        # Битовая карта кадров с детекцией: индекс - номер кадра по модулю frame_skip
+        self._detect_mask = np.zeros(frame_skip, dtype=np.uint8)
+        self._detect_mask[0] = 1
+        self.read_q = queue.Queue(maxsize=prefetch)
+        self.write_q = queue.Queue(maxsize=write_prefetch or prefetch)
+        self._stop = threading.Event()
+        self._error = None
+        self._reader = threading.Thread(target=self._read_loop, name="frame-reader", daemon=True)
+        self._writer = threading.Thread(target=self._write_loop, name="frame-writer", daemon=True)
+
+    def __enter__(self):
+        self._reader.start()
+        self._writer.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Не подменяем исходное исключение ошибкой потока записи
+        self.close(raise_errors=exc_type is None)
+        return False
+
+    def __iter__(self):
+        """
+        Выдает (номер_кадра, кадр, detect) до конца потока.
+        В режиме latest_only перед каждым кадром в dropped - пропущенные
+        до него кадры (валидны до следующей итерации)
+        """
+        while True:
+            item = self.read_q.get()
+            if item is None:
+                break
+            done = False
+            if self.latest_only:
+                item, done = self._latest(item)
+            yield item
+            if done:
+                break
+    
+    def _latest(self, item):
+        """
+        Забирает накопившиеся в очереди кадры, оставляя самый свежий;
+        более старые складываются в dropped.
+        Флаг detect сохраняется, если он был у любого из отброшенных кадров.
+        
+        Returns:
+            (элемент, достигнут_конец_потока)
+        """
+        self.dropped = []
+        detect = item[2]
+        while True:
+            try:
+                newer = self.read_q.get_nowait()
+            except queue.Empty:
+                return (item[0], item[1], detect), False
+            if newer is None:
+                return (item[0], item[1], detect), True
+            self.dropped.append((item[0], item[1]))
+            item = newer
+            detect = detect or newer[2]
+
+    def submit(self, func, *args):
+        """Ставит задание в очередь потока записи"""
+        if self._error is not None:
+            raise self._error
+        self.write_q.put((func, args))
+
+    def _put(self, q, item):
+        """Кладет элемент в очередь, пока конвейер не остановлен"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read_loop(self):
+        """Поток чтения кадров"""
+        frame_idx = 0
+        try:
+            while self.cap.isOpened():
+                if self.max_frames is not None and frame_idx >= self.max_frames:
+                    break
+                frame_idx += 1
+                detect = bool(self._detect_mask[frame_idx % self.frame_skip])
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                if not self._put(self.read_q, (frame_idx, frame, detect)):
+                    return
+        except Exception as e:
+            self._error = e
+        self._put(self.read_q, None)
+
+    def _write_loop(self):
+        """Поток записи: выполняет задания до сигнального None"""
+        while True:
+            job = self.write_q.get()
+            if job is None:
+                break
+            func, args = job
+            try:
+                if self._error is None:
+                    func(*args)
+            except Exception as e:
+                self._error = e
+
+    def close(self, raise_errors=True):
+        """Останавливает потоки и дожидается записи всех кадров"""
+        self._stop.set()
+        # Освобождаем поток чтения, если он ждет места в очереди
+        while True:
+            try:
+                self.read_q.get_nowait()
+            except queue.Empty:
+                break
+        if self._reader.is_alive():
+            self._reader.join()
+        if self._writer.is_alive():
+            self.write_q.put(None)
+            self._writer.join()
+        if self._error is not None and raise_errors:
+            error, self._error = self._error, None
+            raise error
+
+
+class FrameRing:
+    """
+    Кольцо заранее выделенных буферов кадров.
+
+    copy() копирует кадр в следующий буфер кольца вместо выделения
+    нового массива. Буфер перезаписывается через `size` вызовов, поэтому
+    size должен быть больше числа кадров, одновременно находящихся
+    в очередях (например, в очереди записи FramePipeline).
+    """
+
+    def __init__(self, size):
+        """
+        Args:
+            size: число буферов в кольце
+        """
+        self.size = size
+        self._buffers = []
+        self._idx = 0
+
+    def next(self, like):
+        """Возвращает очередной буфер формы like, не копируя данные"""
+        if len(self._buffers) < self.size:
+            buf = np.empty_like(like)
+            self._buffers.append(buf)
+        else:
+            buf = self._buffers[self._idx]
+            if buf.shape != like.shape or buf.dtype != like.dtype:
+                buf = np.empty_like(like)
+                self._buffers[self._idx] = buf
+        self._idx = (self._idx + 1) % self.size
+        return buf
+    
+    def copy(self, frame):
+        """Копирует кадр в очередной буфер и возвращает его"""
+        buf = self.next(frame)
+        np.copyto(buf, frame)
+        return buf
@@ -0,0 +1,169 @@
+"""
+Запись сегментов нарушений: батч-детекция, подтверждение и управление записью
+"""
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from .confirm import confirm_detections, mask_to_names
+from .detection import CLASS_TO_BIT, SLEEP_BIT
+from .pipeline import FrameRing
+
+
+class SegmentRecorder:
+    """
+    Состояние детекции и записи одного прохода по видео.
+
+    Кадры детекции копятся в батч и уходят в YOLO одним вызовом.
+    Подтвержденное нарушение открывает сегмент, который закрывается через
+    buffer_seconds после последнего подтверждения. Батч обрабатывается
+    с опозданием до batch_size * frame_skip кадров, поэтому столько
+    последних кадров держится в кольце pre-roll и пишется в начало сегмента.
+    """
+
+    def __init__(self, pipeline, detector, video_processor, violations_log, frame_size, fps,
+                 metrics, batch_size=8, frame_skip=2, buffer_seconds=10, sleep_buffer=10):
+        """
+        Args:
+            pipeline: FramePipeline, через который идут задания записи
+            detector: ViolationDetector
+            video_processor: VideoProcessor, пишущий сегменты и журнал
+            violations_log: журнал нарушений (st.session_state.violations_log)
+            frame_size: размер кадра (width, height)
+            fps: частота кадров сегментов
+            metrics: метрики обработки (обновляется счетчик нарушений)
+            batch_size: сколько кадров детекции отправлять в YOLO одним батчем
+            frame_skip: детекция на каждом N-м кадре
+            buffer_seconds: буфер записи после исчезновения нарушения
+            sleep_buffer: буфер подтверждения сна в секундах
+        """
+        self.pipeline = pipeline
+        self.detector = detector
+        self.video_processor = video_processor
+        self.violations_log = violations_log
+        self.frame_size = frame_size
+        self.fps = fps
+        self.metrics = metrics
+        self.buffer_seconds = buffer_seconds
+        self.sleep_buffer = sleep_buffer
+
+        # Состояние детекции - для визуализации на каждом кадре
+        self.sleep_start_time = None
+        self.last_detection_time = float('nan')  # NaN - подтвержденных нарушений еще не было
+        self.last_detections = {}
+        self.last_mask = 0
+        self.last_confirmed_mask = 0
+        # Пересечение: какие нарушения одновременно обнаружены И подтверждены
+        self.violations_to_draw = frozenset()
+
+        # Состояние записи
+        self.recording = False
+        self.rec_mask = 0
+        self.segment_path = None
+
+        # Кадры копируются: буфер захвата переиспользуется, пока батч копится
+        self.pending = deque(maxlen=batch_size)  # (кадр, время)
+        self._batch_ring = FrameRing(batch_size)
+        preroll_size = batch_size * frame_skip
+        self._preroll = deque(maxlen=preroll_size)
+        self._preroll_ring = FrameRing(preroll_size)
+
+        # Монотонные часы в цикле; настенное время считаем от них только при записи в журнал
+        self._t0_wall = datetime.now()
+        self._t0_mono = time.monotonic()
+
+    def add_detection_frame(self, frame, now):
+        """Ставит кадр в батч детекции; полный батч сразу отправляется в модель"""
+        self.pending.append((self._batch_ring.copy(frame), now))
+        if len(self.pending) == self.pending.maxlen:
+            self.flush()
+
+    def flush(self):
+        """Детекция накопленных кадров и старт записи при подтвержденном нарушении"""
+        pending = self.pending
+        batch_detections = self.detector.detect_batch([f for f, _ in pending])
+        batch_confirmed, self.sleep_start_time = confirm_detections(
+            [t for _, t in pending], [m for _, m in batch_detections],
+            self.sleep_start_time, self.sleep_buffer, SLEEP_BIT
+        )
+
+        violation_mask = 0
+        for (_, detection_frame_time), (detections, _), confirmed_mask in zip(
+                pending, batch_detections, batch_confirmed):
+            self.metrics['violations'].update(detections.keys())
+            if confirmed_mask:
+                violation_mask |= confirmed_mask
+                self.last_detection_time = detection_frame_time
+        pending.clear()
+
+        # Сохраняем для визуализации
+        self.last_detections, self.last_mask = batch_detections[-1]
+        self.last_confirmed_mask = batch_confirmed[-1]
+        self.violations_to_draw = frozenset(
+            mask_to_names(self.last_confirmed_mask & self.last_mask, CLASS_TO_BIT)
+        )
+
+        # ─── ЛОГИКА ЗАПИСИ ВИДЕО ───
+        if violation_mask:
+            if not self.recording:
+                self._start_segment()
+            # Обновляем типы нарушений (объединяем с уже записанными)
+            self.rec_mask |= violation_mask
+
+    def record(self, annotated_frame):
+        """
+        Кадр после визуализации: во время записи - в сегмент,
+        иначе - в pre-roll на случай, если следующий батч начнет запись
+        """
+        if self.recording:
+            self.pipeline.submit(self.video_processor.write_frame, annotated_frame)
+        else:
+            self._preroll.append(self._preroll_ring.copy(annotated_frame))
+
+    def check_stop(self, now):
+        """Закрывает сегмент, если нарушений нет дольше buffer_seconds"""
+        # last_detection_time - NaN, пока нарушений не было: сравнение с NaN ложно
+        if self.recording and now - self.last_detection_time > self.buffer_seconds:
+            self._finish_segment(now)
+            self.last_confirmed_mask = 0  # Сбрасываем
+            self.violations_to_draw = frozenset()
+
+    def close(self):
+        """
+        Конец потока: неполный батч тоже проходит детекцию (иначе хвост и
+        ролики короче batch_size * frame_skip кадров остались бы без нее),
+        незакрытый сегмент закрывается и попадает в журнал
+        """
+        if self.pending:
+            self.flush()
+        if self.recording:
+            self._finish_segment(time.monotonic())
+
+    def _start_segment(self):
+        """НАЧАЛО записи: новый сегмент начинается с кадров pre-roll"""
+        segments_dir, _ = self.video_processor.setup_output_dirs()
+        self.segment_path = os.path.join(segments_dir, self.video_processor.generate_segment_filename())
+        self.pipeline.submit(self.video_processor.start_recording,
+                             self.segment_path, self.frame_size, self.fps)
+        for frame in self._preroll:
+            self.pipeline.submit(self.video_processor.write_frame, frame)
+        self._preroll.clear()
+        self.recording = True
+        self.rec_mask = 0
+
+    def _finish_segment(self, now):
+        """КОНЕЦ записи: закрывает сегмент и заносит нарушение в журнал"""
+        self.pipeline.submit(self.video_processor.stop_recording)
+        self.recording = False
+
+        # Типы считаются один раз (сортируем для консистентности)
+        rec_types = sorted(mask_to_names(self.rec_mask, CLASS_TO_BIT))
+        self.video_processor.log_violation(self.violations_log, {
+            'path': self.segment_path,
+            'time': (self._t0_wall + timedelta(seconds=now - self._t0_mono)).strftime("%H:%M:%S"),
+            'violation': ", ".join(rec_types),
+            'violation_types': rec_types,
+            'student': 'Обработка...',
+            'confidence': 'N/A'
+        })
@@ -3,25 +3,45 @@
 """
 import os
 import cv2
+import json
+import uuid
 from datetime import datetime
 from pathlib import Path
+from .capture import has_gstreamer, gstreamer_nvenc_pipeline
 
 class VideoProcessor:
     """Обработчик видео и запись сегментов"""
     
     def __init__(self, buffer_seconds=10, frame_skip=2, 
-                 sleep_persistence_seconds=10):
+                 sleep_persistence_seconds=10, max_log_entries=200, use_nvenc=True):
         """
         Args:
             buffer_seconds: буфер записи после исчезновения нарушения
             frame_skip: обрабатывать каждый N-й кадр
             sleep_persistence_seconds: буфер подтверждения сна
+            max_log_entries: сколько последних нарушений держать в памяти
+                             после обработки, полная история - в violations.jsonl
+            use_nvenc: кодировать сегменты на NVENC через GStreamer,
+                       при недоступности - программный mp4v
         """
         self.buffer_seconds = buffer_seconds
         self.frame_skip = frame_skip
         self.sleep_persistence_seconds = sleep_persistence_seconds
+        self.max_log_entries = max_log_entries
+        self.use_nvenc = use_nvenc and has_gstreamer()
+        self._fourcc = cv2.VideoWriter_fourcc(*'mp4v')
         self.writer = None
         self.recording = False
+        self._log_fp = None
+        self._log_path = None
+        # Свой журнал у каждой сессии: violations_<id>.jsonl в папке дня
+        self._session_id = uuid.uuid4().hex[:12]
+        # Файл журнала -> смещение, с которого начинается история (сдвигается при очистке)
+        self._log_offsets = {}
+        self._history_cache = (None, [])
+        self._unresolved_paths = set()
+        # Результаты анализа лиц: (путь, mtime) -> (имя, оценка, путь_к_лицу)
+        self._embed_cache = {}
     
     def setup_output_dirs(self):
         """Создает необходимые директории для выходных файлов"""
@@ -44,12 +64,28 @@ class VideoProcessor:
             frame_size: размер кадра (width, height)
             fps: частота кадров
         """
-        self.writer = cv2.VideoWriter(
-            output_path,
-            cv2.VideoWriter_fourcc(*'mp4v'),
-            fps,
-            frame_size
-        )
+        self.writer = None
+        if self.use_nvenc:
+            self.writer = cv2.VideoWriter(
+                gstreamer_nvenc_pipeline(output_path),
+                cv2.CAP_GSTREAMER,
+                0,
+                fps,
+                frame_size
+            )
+            if not self.writer.isOpened():
+                # Нет NVENC - больше не пытаемся, пишем программно
+                self.writer.release()
+                self.writer = None
+                self.use_nvenc = False
+        
+        if self.writer is None:
+            self.writer = cv2.VideoWriter(
+                output_path,
+                self._fourcc,
+                fps,
+                frame_size
+            )
         self.recording = True
     
     def write_frame(self, frame):
@@ -64,11 +100,139 @@ class VideoProcessor:
             self.writer = None
             self.recording = False
     
+    def log_violation(self, violations_log, entry):
+        """
+        Дописывает нарушение в журнал сессии violations_<id>.jsonl и в журнал в памяти.
+        Журнал обрезается только в close_violations_log() - во время
+        обработки все записи остаются в памяти до распознавания лиц.
+        
+        Args:
+            violations_log: список нарушений (st.session_state.violations_log)
+            entry: словарь с данными нарушения
+        """
+        segments_dir, _ = self.setup_output_dirs()
+        log_path = os.path.join(segments_dir, f"violations_{self._session_id}.jsonl")
+        if self._log_fp is None or self._log_path != log_path:
+            if self._log_fp:
+                self._log_fp.close()
+            if log_path not in self._log_offsets:
+                self._log_offsets[log_path] = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+            self._log_fp = open(log_path, "a", encoding="utf-8", buffering=1)
+            self._log_path = log_path
+        
+        self._log_fp.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        if entry.get('student') == 'Обработка...':
+            self._unresolved_paths.add(entry['path'])
+        
+        violations_log.append(entry)
+    
+    def flush_violation_updates(self, violations_log):
+        """
+        Дописывает в violations.jsonl записи, для которых завершилось
+        распознавание лиц. При чтении файла последняя запись для path главная.
+        """
+        if self._log_fp is None:
+            return
+        for entry in violations_log:
+            if entry['path'] in self._unresolved_paths and entry.get('student') != 'Обработка...':
+                self._log_fp.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self._unresolved_paths.discard(entry['path'])
+    
+    def close_violations_log(self, violations_log):
+        """
+        Завершение обработки: закрывает violations.jsonl и оставляет в памяти
+        последние max_log_entries записей. Вызывается после распознавания
+        лиц, чтобы обрезанные записи тоже были проанализированы.
+        """
+        if self._log_fp is not None:
+            self._log_fp.close()
+            self._log_fp = None
+            self._log_path = None
+        if len(violations_log) > self.max_log_entries:
+            del violations_log[:-self.max_log_entries]
+    
+    def violations_history_key(self):
+        """
+        Ключ состояния истории сессии: (файл, начало, размер, mtime) по всем ее
+        файлам. Меняется только при новых записях или очистке журнала
+        """
+        key = []
+        for log_path, offset in self._log_offsets.items():
+            try:
+                stat = os.stat(log_path)
+            except OSError:
+                continue
+            key.append((log_path, offset, stat.st_size, stat.st_mtime_ns))
+        return tuple(key)
+    
+    def load_violations_history(self):
+        """
+        Полная история нарушений этой сессии из ее violations_<id>.jsonl.
+        Для каждого path берется последняя запись (с итогом распознавания),
+        порядок - по первому появлению. Файл перечитывается, только если
+        изменился violations_history_key(); список не изменять.
+        """
+        key = self.violations_history_key()
+        if self._history_cache[0] != key:
+            self._history_cache = (key, self._read_history())
+        return self._history_cache[1]
+    
+    def _read_history(self):
+        """Читает историю из файлов сессии с сохраненных смещений"""
+        history = {}
+        for log_path, offset in self._log_offsets.items():
+            try:
+                with open(log_path, "rb") as fp:
+                    fp.seek(offset)
+                    for line in fp:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        history[entry['path']] = entry
+            except OSError:
+                continue
+        return list(history.values())
+    
+    def clear_violations_history(self):
+        """Сбрасывает историю сессии: уже записанные строки больше не читаются"""
+        for log_path in self._log_offsets:
+            self._log_offsets[log_path] = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+    
     def generate_segment_filename(self):
         """Генерирует имя файла сегмента на основе времени"""
         timestamp = datetime.now().strftime("%H-%M-%S")
         return f"seg_{timestamp}.mp4"
     
+    @staticmethod
+    def _segment_key(path):
+        """Ключ кэша анализа лиц: сегмент, перезаписанный на диске, анализируется заново"""
+        try:
+            return path, os.path.getmtime(path)
+        except OSError:
+            return None
+    
+    def _seed_embed_cache(self, segments_data):
+        """Заполняет кэш результатами, уже полученными при обработке видео"""
+        for item in segments_data:
+            # Нужна точная оценка: из округленной confidence 0.4996 стало бы 0.5
+            if item.get('student') == 'Обработка...' or 'face_path' not in item or 'score' not in item:
+                continue
+            key = self._segment_key(item['path'])
+            if key is not None:
+                self._embed_cache.setdefault(key, (item['student'], item['score'], item['face_path']))
+    
+    def _analyze_segment_cached(self, face_recognizer, path):
+        """analyze_video_segment с кэшем по (путь, mtime)"""
+        key = self._segment_key(path)
+        if key is not None and key in self._embed_cache:
+            return self._embed_cache[key]
+        
+        result = face_recognizer.analyze_video_segment(path)
+        if key is not None:
+            self._embed_cache[key] = result
+        return result
+    
     def generate_report(self, segments_data, face_recognizer=None):
         """
         Генерирует отчет о нарушениях
@@ -86,28 +250,33 @@ class VideoProcessor:
         
         report_file = os.path.join(report_dir, f"report_{today_date}.txt")
         
-        with open(report_file, "w", encoding="utf-8") as f:
-            f.write("="*70 + "\n")
-            f.write(f"ОТЧЕТ О НАРУШЕНИЯХ | ДАТА: {today_date}\n")
-            f.write("="*70 + "\n\n")
+        self._seed_embed_cache(segments_data)
         
-        # Обработка каждого сегмента
-        for i, item in enumerate(segments_data, 1):
+        # Сначала анализ лиц (долгий), затем запись отчета одним открытием файла
+        students = []
+        for item in segments_data:
             student_info = "Не опознан"
             face_path = "Нет лица"
             
             # Анализ лиц (если доступен)
             if face_recognizer and face_recognizer.is_database_available():
                 try:
-                    name, score, face_path = face_recognizer.analyze_video_segment(
-                        item['path']
+                    name, score, face_path = self._analyze_segment_cached(
+                        face_recognizer, item['path']
                     )
                     student_info = f"{name} ({score:.0%})" if score >= 0.5 else "Не опознан"
                 except Exception:
                     student_info = "Ошибка анализа"
             
+            students.append((student_info, face_path))
+        
+        with open(report_file, "w", encoding="utf-8") as f:
+            f.write("="*70 + "\n")
+            f.write(f"ОТЧЕТ О НАРУШЕНИЯХ | ДАТА: {today_date}\n")
+            f.write("="*70 + "\n\n")
+            
             # Запись в отчет
-            with open(report_file, "a", encoding="utf-8") as f:
+            for i, (item, (student_info, face_path)) in enumerate(zip(segments_data, students), 1):
                 f.write(f"№{i}\n")
                 f.write("-" * 30 + "\n")
                 f.write(f"Время:       {item['time']}\n")